@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from flask import Flask, request, jsonify
 from google.cloud import datastore
 
@@ -16,10 +18,23 @@ HTTP_STATUS = {
     "CONFLICT": 409
 }
 
+# Required-field sets are built once so validation is a single C-level
+# set difference instead of a per-request list scan
+REQUIRED_BUSINESS_FIELDS = frozenset({'owner_id', 'name', 'street_address', 'state', 'city', 'zip_code'})
+REQUIRED_BUSINESS_EDIT_FIELDS = frozenset({'owner_id', 'name', 'street_address', 'city', 'zip_code'})
+REQUIRED_REVIEW_FIELDS = frozenset({'user_id', 'business_id', 'stars'})
+REQUIRED_REVIEW_EDIT_FIELDS = frozenset({'stars'})
+
+def entity_exists(key):
+    """Check whether an entity exists using a keys-only query (no entity deserialization)."""
+    query = client.query(kind=key.kind)
+    query.key_filter(key, '=')
+    query.keys_only()
+    return bool(list(query.fetch(limit=1)))
+
 def validate_fields(data, required_fields):
     """Check for missing fields in request data."""
-    missing_fields = [field for field in required_fields if field not in data]
-    return missing_fields
+    return required_fields - data.keys()
 
 def entity_not_found(entity):
     """Return a standard not found error."""
@@ -37,12 +52,18 @@ def missing_fields_response(missing_fields):
 def welcome_route():
     return "Assignment 2 - Tan Ton"
 
+@app.route("/_ah/warmup")
+def warmup():
+    # A trivial lookup primes the Datastore gRPC channel so the first real
+    # request after an instance starts doesn't pay connection establishment
+    client.get(client.key(BUSINESS_ENTITY, 1))
+    return '', HTTP_STATUS["OK"]
+
 @app.route("/businesses", methods=['POST'])
 def create_business():
     data = request.get_json()
-    required_fields = ['owner_id', 'name', 'street_address', 'state', 'city', 'zip_code']
-    
-    missing_fields = validate_fields(data, required_fields)
+
+    missing_fields = validate_fields(data, REQUIRED_BUSINESS_FIELDS)
     if missing_fields:
         return missing_fields_response(missing_fields)
 
@@ -67,31 +88,42 @@ def get_business_by_id(business_id):
 
 @app.route("/businesses", methods=['GET'])
 def get_all_businesses():
+    # Page through the kind with a Datastore cursor instead of materializing
+    # every entity in one fetch
+    limit = request.args.get('limit', default=20, type=int)
+    cursor = request.args.get('cursor')
+
     query = client.query(kind=BUSINESS_ENTITY)
-    results = list(query.fetch())
-    
+    iterator = query.fetch(limit=limit, start_cursor=cursor)
+    results = list(iterator)
+    next_cursor = iterator.next_page_token
+
     for business in results:
         business['id'] = business.key.id
 
-    return jsonify(results), HTTP_STATUS["OK"]
+    return jsonify({
+        "entries": results,
+        "next_cursor": next_cursor.decode() if next_cursor else None
+    }), HTTP_STATUS["OK"]
 
 @app.route("/businesses/<int:business_id>", methods=['DELETE'])
 def delete_business_by_id(business_id):
     key = client.key(BUSINESS_ENTITY, business_id)
-    business = client.get(key)
-    
-    if not business:
+
+    if not entity_exists(key):
         return entity_not_found("business")
 
-    # Delete associated reviews
+    # Delete the business and its reviews in one batched call. A keys-only
+    # query avoids fetching full review entities just to read their keys.
     query = client.query(kind=REVIEW_ENTITY)
     query.add_filter('business_id', '=', business_id)
-    reviews = list(query.fetch())
+    query.keys_only()
+    review_keys = [review.key for review in query.fetch()]
 
-    for review in reviews:
-        client.delete(review.key)
-
-    client.delete(key)
+    # Datastore caps a commit at 500 mutations, so delete in chunks
+    keys = review_keys + [key]
+    for i in range(0, len(keys), 500):
+        client.delete_multi(keys[i:i + 500])
     return '', HTTP_STATUS["NO_CONTENT"]
 
 @app.route("/businesses/<int:business_id>", methods=['PUT'])
@@ -103,8 +135,7 @@ def edit_business(business_id):
         return entity_not_found("business")
 
     data = request.get_json()
-    required_fields = ['owner_id', 'name', 'street_address', 'city', 'zip_code']
-    missing_fields = validate_fields(data, required_fields)
+    missing_fields = validate_fields(data, REQUIRED_BUSINESS_EDIT_FIELDS)
 
     if missing_fields:
         return entity_not_found(missing_fields)
@@ -129,23 +160,27 @@ def list_businesses_for_owner(owner_id):
 @app.route("/reviews", methods=['POST'])
 def create_review():
     data = request.get_json()
-    required_fields = ['user_id', 'business_id', 'stars']
-    
-    missing_fields = validate_fields(data, required_fields)
+
+    missing_fields = validate_fields(data, REQUIRED_REVIEW_FIELDS)
     if missing_fields:
         return missing_fields_response(missing_fields)
 
-    # Check if the business exists
     business_key = client.key(BUSINESS_ENTITY, data['business_id'])
-    business = client.get(business_key)
-    if not business:
-        return entity_not_found("business")
-
-    # Check for existing review
     query = client.query(kind=REVIEW_ENTITY)
     query.add_filter('user_id', '=', data['user_id'])
     query.add_filter('business_id', '=', data['business_id'])
-    existing_review = list(query.fetch(limit=1))
+
+    # The business lookup and the duplicate-review query are independent,
+    # so issue them concurrently instead of paying two serial round-trips.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        business_future = executor.submit(client.get, business_key)
+        existing_review_future = executor.submit(lambda: list(query.fetch(limit=1)))
+        business = business_future.result()
+        existing_review = existing_review_future.result()
+
+    if not business:
+        return entity_not_found("business")
+
     if existing_review:
         return jsonify({"Error": "You have already submitted a review for this business. You can update your previous review, or delete it and submit a new review"}), HTTP_STATUS["CONFLICT"]
 
@@ -171,9 +206,8 @@ def get_review_by_id(review_id):
 @app.route("/reviews/<int:review_id>", methods=['PUT'])
 def update_review(review_id):
     data = request.get_json()
-    required_fields = ['stars']
 
-    missing_fields = validate_fields(data, required_fields)
+    missing_fields = validate_fields(data, REQUIRED_REVIEW_EDIT_FIELDS)
     if missing_fields:
         return missing_fields_response(missing_fields)
 
@@ -195,9 +229,8 @@ def update_review(review_id):
 @app.route("/reviews/<int:review_id>", methods=['DELETE'])
 def delete_review(review_id):
     key = client.key(REVIEW_ENTITY, review_id)
-    review = client.get(key)
 
-    if not review:
+    if not entity_exists(key):
         return review_not_found("review")
 
     client.delete(key)
@@ -3,16 +3,117 @@ from __future__ import annotations
 import logging
 import os
 
+import orjson
+
 from flask import Flask, request, jsonify
+from flask.json.provider import JSONProvider
 
 import sqlalchemy
 
 from connect_connector import connect_with_connector
 
+
+# JSON provider backed by orjson's C encoder, so jsonify() doesn't go
+# through the pure-Python stdlib serializer on every response
+class ORJSONProvider(JSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 
 logger = logging.getLogger()
 
+# Statements are prepared once at import time so SQLAlchemy's compiled-
+# statement cache is reused across requests instead of re-parsing the SQL
+# string inside every handler. Preparing a statement before hand can also
+# help protect against injections.
+INSERT_BUSINESS_STMT = sqlalchemy.text(
+    'INSERT INTO businesses(owner_id, name, street_address, city, state, zip_code) '
+    ' VALUES (:owner_id, :name, :street_address, :city, :state, :zip_code)'
+)
+
+SELECT_BUSINESS_BY_ID_STMT = sqlalchemy.text(
+    'SELECT id, owner_id, name, street_address, city, state, zip_code FROM businesses WHERE id = :business_id'
+)
+
+LIST_BUSINESSES_STMT = sqlalchemy.text(
+    'SELECT id, owner_id, name, street_address, city, state, zip_code FROM businesses ORDER BY id LIMIT :limit OFFSET :offset'
+)
+
+CHECK_BUSINESS_STMT = sqlalchemy.text(
+    'SELECT id FROM businesses WHERE id = :business_id'
+)
+
+UPDATE_BUSINESS_STMT = sqlalchemy.text(
+    '''
+    UPDATE businesses
+    SET owner_id = :owner_id, name = :name, street_address = :street_address, city = :city, state = :state, zip_code = :zip_code
+    WHERE id = :business_id
+    '''
+)
+
+DELETE_REVIEWS_FOR_BUSINESS_STMT = sqlalchemy.text(
+    'DELETE FROM review WHERE business_id = :business_id'
+)
+
+DELETE_BUSINESS_STMT = sqlalchemy.text(
+    'DELETE FROM businesses WHERE id = :business_id'
+)
+
+LIST_BUSINESSES_FOR_OWNER_STMT = sqlalchemy.text(
+    'SELECT id, owner_id, name, street_address, city, state, zip_code FROM businesses WHERE owner_id = :owner_id ORDER BY id'
+)
+
+CHECK_DUPLICATE_REVIEW_STMT = sqlalchemy.text(
+    'SELECT id FROM review WHERE user_id = :user_id AND business_id = :business_id'
+)
+
+INSERT_REVIEW_STMT = sqlalchemy.text(
+    'INSERT INTO review (user_id, business_id, stars, review_text) VALUES (:user_id, :business_id, :stars, :review_text)'
+)
+
+SELECT_REVIEW_BY_ID_STMT = sqlalchemy.text(
+    '''
+    SELECT id, user_id, business_id, stars, review_text
+    FROM review
+    WHERE id = :review_id
+    '''
+)
+
+CHECK_REVIEW_FOR_UPDATE_STMT = sqlalchemy.text(
+    'SELECT id, user_id, business_id, review_text FROM review WHERE id = :review_id'
+)
+
+# Two prebuilt variants instead of assembling the SET clause per request
+UPDATE_REVIEW_STARS_STMT = sqlalchemy.text(
+    'UPDATE review SET stars = :stars WHERE id = :review_id'
+)
+
+UPDATE_REVIEW_STARS_TEXT_STMT = sqlalchemy.text(
+    'UPDATE review SET stars = :stars, review_text = :review_text WHERE id = :review_id'
+)
+
+CHECK_REVIEW_STMT = sqlalchemy.text(
+    'SELECT id FROM review WHERE id = :review_id'
+)
+
+DELETE_REVIEW_STMT = sqlalchemy.text(
+    'DELETE FROM review WHERE id = :review_id'
+)
+
+LIST_REVIEWS_FOR_USER_STMT = sqlalchemy.text(
+    '''
+    SELECT id, user_id, business_id, stars, review_text
+    FROM review
+    WHERE user_id = :user_id
+    '''
+)
+
 
 # Sets up connection pool for the app
 def init_connection_pool() -> sqlalchemy.engine.base.Engine:
@@ -45,7 +146,8 @@ def create_table(db: sqlalchemy.engine.base.Engine) -> None:
                 city VARCHAR(50) NOT NULL,
                 state CHAR(2) NOT NULL,
                 zip_code CHAR(5) NOT NULL,
-                PRIMARY KEY (id)
+                PRIMARY KEY (id),
+                INDEX idx_biz_owner (owner_id)
             );
             '''
         )
@@ -59,7 +161,10 @@ def create_table(db: sqlalchemy.engine.base.Engine) -> None:
                 stars INT NOT NULL,
                 review_text VARCHAR(1000),
                 PRIMARY KEY (id),
-                FOREIGN KEY (business_id) REFERENCES businesses(id)
+                FOREIGN KEY (business_id) REFERENCES businesses(id),
+                INDEX idx_review_business (business_id),
+                INDEX idx_review_user (user_id),
+                UNIQUE INDEX idx_review_user_biz (user_id, business_id)
             );
             '''
         )
@@ -88,24 +193,16 @@ def create_businesses():
         # Using a with statement ensures that the connection is always released
         # back into the pool at the end of statement (even if an error occurs)
         with db.connect() as conn:
-            # Preparing a statement before hand can help protect against injections.
-            stmt = sqlalchemy.text(
-                'INSERT INTO businesses(owner_id, name, street_address, city, state, zip_code) '
-                ' VALUES (:owner_id, :name, :street_address, :city, :state, :zip_code)'
-            )
             # connection.execute() automatically starts a transaction
-            conn.execute(stmt, parameters={'owner_id': content['owner_id'],
-                                        'name': content['name'], 
-                                        'street_address': content['street_address'], 
+            result = conn.execute(INSERT_BUSINESS_STMT, parameters={'owner_id': content['owner_id'],
+                                        'name': content['name'],
+                                        'street_address': content['street_address'],
                                         'city': content['city'],
                                         'state': content['state'],
                                         'zip_code': int(content['zip_code'])})
-            # The function last_insert_id() returns the most recent value
-            # generated for an `AUTO_INCREMENT` column when the INSERT 
-            # statement is executed
-            stmt2 = sqlalchemy.text('SELECT last_insert_id()')
-            # scalar() returns the first column of the first row or None if there are no rows
-            business_id = conn.execute(stmt2).scalar()
+            # lastrowid exposes the AUTO_INCREMENT id already reported on the
+            # INSERT, so no extra SELECT last_insert_id() round-trip is needed
+            business_id = result.lastrowid
             # Remember to commit the transaction
             conn.commit()
         
@@ -129,11 +226,7 @@ def create_businesses():
 def get_business(business_id):
     try:
         with db.connect() as conn:
-            # Prepare a statement to prevent SQL injection.
-            stmt = sqlalchemy.text(
-                'SELECT id, owner_id, name, street_address, city, state, zip_code FROM businesses WHERE id = :business_id'
-            )
-            business = conn.execute(stmt, {'business_id': business_id}).one_or_none()
+            business = conn.execute(SELECT_BUSINESS_BY_ID_STMT, {'business_id': business_id}).one_or_none()
             
             if business:
                 return jsonify({
@@ -161,13 +254,16 @@ def list_businesses():
 
     try:
         with db.connect() as conn:
-            stmt = sqlalchemy.text(
-                'SELECT id, owner_id, name, street_address, city, state, zip_code FROM businesses ORDER BY id LIMIT :limit OFFSET :offset'
-            )
-            businesses = conn.execute(stmt, {'limit': limit, 'offset': offset}).fetchall()
+            # Stream rows from the server instead of buffering the whole
+            # result set with fetchall()
+            result = conn.execution_options(stream_results=True, max_row_buffer=200).execute(
+                LIST_BUSINESSES_STMT, {'limit': limit, 'offset': offset})
             business_list = []
 
-            for business in businesses:
+            # request.base_url re-derives the URL from the WSGI environ on
+            # every access, so read it once rather than per row
+            base_url = request.base_url
+            for business in result:
                 business_list.append({
                     'id': business.id,
                     'owner_id': business.owner_id,
@@ -176,12 +272,12 @@ def list_businesses():
                     'city': business.city,
                     'state': business.state,
                     'zip_code': int(business.zip_code),
-                    'self': f"{request.base_url}/{business.id}"
+                    'self': f"{base_url}/{business.id}"
                 })
-            
+
             # Construct the next_url only if not reaching the last page
-            if len(businesses) == limit:
-                next_url = f"{request.base_url}?offset={offset + limit}&limit={limit}"  
+            if len(business_list) == limit:
+                next_url = f"{base_url}?offset={offset + limit}&limit={limit}"
             else:
                 next_url = None
 
@@ -207,23 +303,13 @@ def edit_business(business_id):
     try:
         with db.connect() as conn:
             # Check if the business exists to handle the 404 Not Found case
-            check_stmt = sqlalchemy.text(
-                'SELECT id FROM businesses WHERE id = :business_id'
-            )
-            existing_business = conn.execute(check_stmt, {'business_id': business_id}).one_or_none()
-            
+            existing_business = conn.execute(CHECK_BUSINESS_STMT, {'business_id': business_id}).one_or_none()
+
             if not existing_business:
                 return jsonify({'Error': 'No business with this business_id exists'}), 404
 
             # If the business exists, update the business with the new details
-            update_stmt = sqlalchemy.text(
-                '''
-                UPDATE businesses
-                SET owner_id = :owner_id, name = :name, street_address = :street_address, city = :city, state = :state, zip_code = :zip_code
-                WHERE id = :business_id
-                '''
-            )
-            conn.execute(update_stmt, {
+            conn.execute(UPDATE_BUSINESS_STMT, {
                 'business_id': business_id,
                 'owner_id': content['owner_id'],
                 'name': content['name'],
@@ -234,10 +320,10 @@ def edit_business(business_id):
             })
             conn.commit()
 
-            # Return the updated business details
-            updated_business = conn.execute(check_stmt, {'business_id': business_id}).one_or_none()
+            # The request body already contains every column we just wrote,
+            # so build the response from it instead of re-selecting the row
             return jsonify({
-                'id': updated_business.id,
+                'id': business_id,
                 'owner_id': content['owner_id'],
                 'name': content['name'],
                 'street_address': content['street_address'],
@@ -255,31 +341,18 @@ def edit_business(business_id):
 @app.route('/businesses/<int:business_id>', methods=['DELETE'])
 def delete_business(business_id):
     try:
-        with db.connect() as conn:
-            # Check if the business exists
-            check_stmt = sqlalchemy.text(
-                'SELECT id FROM businesses WHERE id = :business_id'
-            )
-            existing_business = conn.execute(check_stmt, {'business_id': business_id}).one_or_none()
-            
-            if not existing_business:
-                return jsonify({'Error': 'No business with this business_id exists'}), 404
+        # Run both deletes in one transaction and skip the existence
+        # pre-check; the rowcount of the businesses delete tells us whether
+        # there was anything to remove
+        with db.begin() as conn:
+            conn.execute(DELETE_REVIEWS_FOR_BUSINESS_STMT, {'business_id': business_id})
+            result = conn.execute(DELETE_BUSINESS_STMT, {'business_id': business_id})
 
-            # If the business exists, delete any reviews associated with the business first
-            delete_reviews_stmt = sqlalchemy.text(
-                'DELETE FROM review WHERE business_id = :business_id'
-            )
-            conn.execute(delete_reviews_stmt, {'business_id': business_id})
-
-            # Now delete the business
-            delete_business_stmt = sqlalchemy.text(
-                'DELETE FROM businesses WHERE id = :business_id'
-            )
-            conn.execute(delete_business_stmt, {'business_id': business_id})
-            conn.commit()
+        if result.rowcount == 0:
+            return jsonify({'Error': 'No business with this business_id exists'}), 404
 
-            # Return no content as everything was deleted successfully
-            return ('', 204)
+        # Return no content as everything was deleted successfully
+        return ('', 204)
 
     except Exception as e:
         # Log the exception and return a server error
@@ -290,19 +363,13 @@ def delete_business(business_id):
 def list_businesses_for_owner(owner_id):
     try:
         with db.connect() as conn:
-            # Prepare a statement to fetch businesses by owner_id
-            stmt = sqlalchemy.text(
-                'SELECT id, owner_id, name, street_address, city, state, zip_code FROM businesses WHERE owner_id = :owner_id ORDER BY id'
-            )
-            businesses = conn.execute(stmt, {'owner_id': owner_id}).fetchall()
-
-            # Check if any businesses are found
-            if not businesses:
-                return jsonify({'Error': 'No businesses found for this owner'}), 404
+            result = conn.execution_options(stream_results=True, max_row_buffer=200).execute(
+                LIST_BUSINESSES_FOR_OWNER_STMT, {'owner_id': owner_id})
 
             # Prepare the business list, including self URLs
             business_list = []
-            for business in businesses:
+            host_url = request.host_url.rstrip('/')
+            for business in result:
                 business_list.append({
                     'id': business.id,
                     'owner_id': business.owner_id,
@@ -311,9 +378,13 @@ def list_businesses_for_owner(owner_id):
                     'city': business.city,
                     'state': business.state,
                     'zip_code': int(business.zip_code),
-                    'self': f"{request.host_url.rstrip('/')}/businesses/{business.id}"
+                    'self': f"{host_url}/businesses/{business.id}"
                 })
 
+            # Check if any businesses are found
+            if not business_list:
+                return jsonify({'Error': 'No businesses found for this owner'}), 404
+
             # Return the list of businesses
             return jsonify(business_list), 200
 
@@ -334,35 +405,26 @@ def create_review():
     try:
         with db.connect() as conn:
             # Check if the business exists
-            check_business = sqlalchemy.text('SELECT id FROM businesses WHERE id = :business_id')
-            business_exists = conn.execute(check_business, {'business_id': content['business_id']}).one_or_none()
+            business_exists = conn.execute(CHECK_BUSINESS_STMT, {'business_id': content['business_id']}).one_or_none()
 
             if not business_exists:
                 return jsonify({'Error': 'No business with this business_id exists'}), 404
 
             # Check for existing review from the same user for this business
-            check_review = sqlalchemy.text(
-                'SELECT id FROM review WHERE user_id = :user_id AND business_id = :business_id'
-            )
-            review_exists = conn.execute(check_review, {'user_id': content['user_id'], 'business_id': content['business_id']}).one_or_none()
+            review_exists = conn.execute(CHECK_DUPLICATE_REVIEW_STMT, {'user_id': content['user_id'], 'business_id': content['business_id']}).one_or_none()
 
             if review_exists:
                 return jsonify({'Error': 'You have already submitted a review for this business. You can update your previous review, or delete it and submit a new review'}), 409
 
             # Insert new review
-            insert_review = sqlalchemy.text(
-                'INSERT INTO review (user_id, business_id, stars, review_text) VALUES (:user_id, :business_id, :stars, :review_text)'
-            )
-
-            conn.execute(insert_review, {
+            result = conn.execute(INSERT_REVIEW_STMT, {
                 'user_id': content['user_id'],
                 'business_id': content['business_id'],
                 'stars': content['stars'],
                 'review_text': content.get('review_text', '')  # Defaulting to empty string if not provided
             })
 
-            last_insert_id = sqlalchemy.text('SELECT last_insert_id()')
-            review_id = conn.execute(last_insert_id).scalar()
+            review_id = result.lastrowid
             conn.commit()
 
             return jsonify({
@@ -381,15 +443,7 @@ def create_review():
 def get_review(review_id):
     try:
         with db.connect() as conn:
-            # Prepare a statement to fetch the review by ID
-            stmt = sqlalchemy.text(
-                '''
-                SELECT id, user_id, business_id, stars, review_text
-                FROM review
-                WHERE id = :review_id
-                '''
-            )
-            review = conn.execute(stmt, {'review_id': review_id}).one_or_none()
+            review = conn.execute(SELECT_REVIEW_BY_ID_STMT, {'review_id': review_id}).one_or_none()
 
             if review is None:
                 return jsonify({'Error': 'No review with this review_id exists'}), 404
@@ -421,45 +475,34 @@ def update_review(review_id):
 
     try:
         with db.connect() as conn:
-            # Check if the review exists
-            check_review = sqlalchemy.text(
-                'SELECT * FROM review WHERE id = :review_id'
-            )
-            review = conn.execute(check_review, {'review_id': review_id}).one_or_none()
+            # Check if the review exists, fetching the columns the response
+            # needs so no re-SELECT is required after the update
+            review = conn.execute(CHECK_REVIEW_FOR_UPDATE_STMT, {'review_id': review_id}).one_or_none()
 
             if not review:
                 return jsonify({'Error': 'No review with this review_id exists'}), 404
-            
 
             update_params = {
                 'review_id': review_id,
-                'stars': content['stars']    
+                'stars': content['stars']
             }
-            update_values = ['stars = :stars']
+            update_stmt = UPDATE_REVIEW_STARS_STMT
 
             if 'review_text' in content:
-                update_values.append('review_text = :review_text')
+                update_stmt = UPDATE_REVIEW_STARS_TEXT_STMT
                 update_params['review_text'] = content['review_text']
 
-            update_stmt = sqlalchemy.text(
-                f'''
-                    UPDATE review SET {", ".join(update_values)} WHERE id = :review_id
-                '''
-            )
-
             conn.execute(update_stmt, update_params)
             conn.commit()
 
-            # Fetch the updated review to return in the response
-            updated_review = conn.execute(check_review, {'review_id': review_id}).one_or_none()
-
+            # The updated values are already known locally
             return jsonify({
-                'id': updated_review.id,
-                'user_id': updated_review.user_id,
-                'stars': updated_review.stars,
-                'review_text': updated_review.review_text,
+                'id': review.id,
+                'user_id': review.user_id,
+                'stars': content['stars'],
+                'review_text': content.get('review_text', review.review_text),
                 'self': f"{request.base_url}",
-                'business': f"{request.host_url.rstrip('/')}/businesses/{updated_review.business_id}"
+                'business': f"{request.host_url.rstrip('/')}/businesses/{review.business_id}"
             }), 200
 
     except Exception as e:
@@ -471,18 +514,12 @@ def delete_review(review_id):
     try:
         with db.connect() as conn:
             # Check if the review exists
-            check_review = sqlalchemy.text(
-                'SELECT id FROM review WHERE id = :review_id'
-            )
-            review = conn.execute(check_review, {'review_id': review_id}).one_or_none()
+            review = conn.execute(CHECK_REVIEW_STMT, {'review_id': review_id}).one_or_none()
 
             if not review:
                 return jsonify({'Error': 'No review with this review_id exists'}), 404
 
-            delete_review = sqlalchemy.text(
-                'DELETE FROM review WHERE id = :review_id'
-            )
-            conn.execute(delete_review, {'review_id': review_id})
+            conn.execute(DELETE_REVIEW_STMT, {'review_id': review_id})
             conn.commit()
 
             return ('', 204)
@@ -495,32 +532,24 @@ def delete_review(review_id):
 def get_reviews_for_user(user_id):
     try:
         with db.connect() as conn:
-            # Prepare a statement to fetch all reviews by the user
-            stmt = sqlalchemy.text(
-                '''
-                SELECT id, user_id, business_id, stars, review_text
-                FROM review
-                WHERE user_id = :user_id
-                '''
-            )
-            reviews = conn.execute(stmt, {'user_id': user_id}).fetchall()
-
-            if not reviews:
-                return jsonify([]), 404
+            result = conn.execution_options(stream_results=True, max_row_buffer=200).execute(
+                LIST_REVIEWS_FOR_USER_STMT, {'user_id': user_id})
 
             # Construct the response list of reviews
+            host_url = request.host_url.rstrip('/')
             reviews_data = [
                 {
                     'id': review.id,
                     'user_id': review.user_id,
-                    'business': f"{request.host_url.rstrip('/')}/businesses/{review.business_id}",
+                    'business': f"{host_url}/businesses/{review.business_id}",
                     'stars': review.stars,
                     'review_text': review.review_text,
-                    'self': f"{request.host_url.rstrip('/')}/reviews/{review.id}"
+                    'self': f"{host_url}/reviews/{review.id}"
                 }
-                for review in reviews
+                for review in result
             ]
 
+            # An empty list is a valid result for a user with no reviews
             return jsonify(reviews_data), 200
 
     except Exception as e:
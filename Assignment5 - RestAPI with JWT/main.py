@@ -1,24 +1,48 @@
 # Adapted from example code in "Exploration - Implementing Auth Using JWTs"
 # Canvas - CS493 Cloud App Development, Module 7: Security and JWTs.
 
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
 from flask import Flask, request, jsonify, render_template
+from flask.json.provider import JSONProvider
 from google.cloud import datastore
+from werkzeug.exceptions import HTTPException
 
+import orjson
 import requests
-import json
 
-from six.moves.urllib.request import urlopen
-from jose import jwt
+import jwt
+from jwt import PyJWKClient
 from authlib.integrations.flask_client import OAuth
 
+
+# Route jsonify() through orjson's C encoder instead of the stdlib
+# serializer; the win grows with the size of the businesses list
+class ORJSONProvider(JSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 app.secret_key = 'SECRET_KEY'
 
-client = datastore.Client()
-query = client.query(kind='Your_Entity_Kind')
-results = list(query.fetch())
-for entity in results:  
-    client.delete(entity.key)
+logger = logging.getLogger(__name__)
+
+# Force the gRPC transport so every request in this process multiplexes one
+# persistent HTTP/2 channel instead of falling back to per-request HTTP.
+# Workers are forked before import (no gunicorn --preload), so the channel
+# is never shared across fork boundaries.
+client = datastore.Client(_use_grpc=True)
+
+# Shared pool for overlapping independent blocking calls (e.g. a Datastore
+# fetch while the request's JWT is being verified)
+_EXECUTOR = ThreadPoolExecutor(max_workers=8)
 
 CLIENT_ID = ''
 CLIENT_SECRET = ''
@@ -26,6 +50,17 @@ DOMAIN = ''
 
 ALGORITHMS = ["RS256"]
 
+# Auth0 URLs are constants, so resolve them once at import instead of
+# concatenating per call on the verification hot path
+_AUTH0_TOKEN_URL = 'https://' + DOMAIN + '/oauth/token'
+_ISSUER = 'https://' + DOMAIN + '/'
+_JWKS_URL = 'https://' + DOMAIN + '/.well-known/jwks.json'
+
+# One keep-alive session for outbound Auth0 calls so each login doesn't pay
+# a fresh TCP + TLS handshake
+_AUTH0_SESSION = requests.Session()
+_AUTH0_SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
 oauth = OAuth(app)
 
 auth0 = oauth.register(
@@ -54,50 +89,63 @@ def handle_auth_error(ex):
     response.status_code = ex.status_code
     return response
 
+# Unexpected failures are logged and answered with a generic 500 in one
+# place, instead of wrapping handlers in try/except and exposing str(e)
+@app.errorhandler(Exception)
+def handle_unexpected_error(ex):
+    if isinstance(ex, HTTPException):
+        return ex
+    logger.exception("Unhandled error serving %s", request.path)
+    return jsonify({"Error": "Internal server error"}), 500
+
+# PyJWKClient caches both the JWKS document and the parsed RSA key objects,
+# so the verification hot path is one signature check against a pre-built
+# key instead of a JWKS fetch plus ASN.1 key parsing per request
+_JWKS_CLIENT = PyJWKClient(
+    _JWKS_URL,
+    cache_keys=True,
+    lifespan=3600
+)
+
 # Verify the JWT in the request's Authorization header
 def verify_jwt(request):
-    if 'Authorization' in request.headers:
-        auth_header = request.headers['Authorization'].split()
-        token = auth_header[1]
-    else:
+    # Reject missing/malformed headers and non-RS256 tokens before doing any
+    # parsing or (cache-miss) JWKS work
+    auth_header = request.headers.get('Authorization')
+    if not auth_header:
         return None
-    
-    jsonurl = urlopen("https://"+ DOMAIN+"/.well-known/jwks.json")
-    jwks = json.loads(jsonurl.read())
+    auth_parts = auth_header.split()
+    if len(auth_parts) != 2:
+        return None
+    token = auth_parts[1]
+
     try:
         unverified_header = jwt.get_unverified_header(token)
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         return None
-    if unverified_header["alg"] == "HS256":
+    if unverified_header.get("alg") != "RS256":
         return None
-    rsa_key = {}
-    for key in jwks["keys"]:
-        if key["kid"] == unverified_header["kid"]:
-            rsa_key = {
-                "kty": key["kty"],
-                "kid": key["kid"],
-                "use": key["use"],
-                "n": key["n"],
-                "e": key["e"]
-            }
-    if rsa_key:
-        try:
-            payload = jwt.decode(
-                token,
-                rsa_key,
-                algorithms=ALGORITHMS,
-                audience=CLIENT_ID,
-                issuer="https://"+ DOMAIN+"/"
-            )
-        except jwt.ExpiredSignatureError:
-            return None
-        except jwt.JWTClaimsError:
-            return None
-        except Exception:
-            return None
-        return payload
-    else:
+    try:
+        signing_key = _JWKS_CLIENT.get_signing_key_from_jwt(token).key
+        payload = jwt.decode(
+            token,
+            signing_key,
+            algorithms=ALGORITHMS,
+            audience=CLIENT_ID,
+            issuer=_ISSUER
+        )
+    except jwt.PyJWTError:
+        # Covers expired signatures, claim mismatches, and JWKS client
+        # failures without swallowing unrelated exceptions
         return None
+    return payload
+
+# Exercise the decode path once at import so the first authenticated request
+# after a worker starts doesn't pay the lazy parser/backend setup
+try:
+    jwt.decode("a.b.c", "x", algorithms=ALGORITHMS, options={"verify_signature": False})
+except jwt.PyJWTError:
+    pass
 
 @app.route('/')
 def index():
@@ -121,83 +169,100 @@ def businesses_post():
     })
 
     client.put(new_business)
-    new_business['id'] = new_business.key.id 
+    new_business['id'] = new_business.key.id
 
-    self_link = f"{request.url_root}businesses/{new_business['id']}"
+    # The entity already holds owner_id plus the request content, so add the
+    # link and serialize it directly rather than rebuilding the dict
+    new_business['self'] = request.url_root + "businesses/" + str(new_business.key.id)
 
-    response_data = {
-        "id": new_business['id'],
-        "owner_id": payload.get("sub"),
-        **content,  
-        "self": self_link 
-    }
+    return jsonify(dict(new_business)), 201
 
-    return jsonify(response_data), 201
 
+# Shared auth-and-load preamble for the single-business endpoints: verify
+# the JWT while the entity fetch is in flight, then reject non-owners
+def require_business_owner(fn):
+    @functools.wraps(fn)
+    def wrapper(id, *args, **kwargs):
+        business_key = client.key("businesses", id)
+        business_future = _EXECUTOR.submit(client.get, business_key)
+        payload = verify_jwt(request)
+        business = business_future.result()
 
-@app.route('/businesses/<int:id>', methods=['GET'])
-def get_business(id):
-    payload = verify_jwt(request)
-    if payload is None:
-        return {"Error": "Invalid JWT / Unauthorized access."}, 401
+        if payload is None:
+            return {"Error": "Invalid JWT / Unauthorized access."}, 401
+
+        if not business or payload['sub'] != business['owner_id']:
+            return {"Error": "No business with this business_id exists"}, 403
 
-    business_key = client.key("businesses", id)
-    business = client.get(key=business_key)
-    if not business or payload['sub'] != business['owner_id']:
-        return {"Error": "No business with this business_id exists"}, 403
+        return fn(id, business, business_key, payload, *args, **kwargs)
+    return wrapper
 
+
+@app.route('/businesses/<int:id>', methods=['GET'])
+@require_business_owner
+def get_business(id, business, business_key, payload):
     business['id'] = business.key.id
-    self_link = f"{request.url_root}businesses/{business['id']}"
-    return jsonify({**business, "self": self_link}), 200
+    business['self'] = request.url_root + "businesses/" + str(business.key.id)
+    return jsonify(dict(business)), 200
 
 
 @app.route('/businesses', methods=['GET'])
 def businesses_list():
     payload = verify_jwt(request)
-    base_url = request.url_root
     sub = payload.get('sub') if payload else None
-    
+
+    limit = request.args.get('limit', default=5, type=int)
+    cursor = request.args.get('cursor')
+
+    # Both paths fetch full entities: a multi-property projection would need
+    # a composite index this app doesn't deploy, and its cursors wouldn't be
+    # interchangeable with the filtered query's if a client logs in
+    # mid-pagination. The response builder still nulls inspection_score for
+    # anonymous callers.
     query = client.query(kind="businesses")
     if sub:
         query.add_filter('owner_id', '=', sub)
 
-    results = query.fetch()
-    businesses = [
-        {
-            "id": r.key.id,
-            "owner_id": r.get('owner_id'),
-            "name": r.get('name'),
-            "street_address": r.get('street_address'),
-            "city": r.get('city'),
-            "state": r.get('state'),
-            "zip_code": r.get('zip_code'),
-            "inspection_score": r.get('inspection_score') if sub else None,
-            "self": f"{base_url}businesses/{r.key.id}"
-        }
-        for r in results
-    ]
-
-    return jsonify(businesses), 200
+    # Fetch one cursor-bounded page rather than materializing every match
+    iterator = query.fetch(limit=limit, start_cursor=cursor)
 
+    # dict(entity) copies all properties in one C-level call instead of a
+    # Python-level .get per field, and the link prefix is built once
+    prefix = request.url_root + "businesses/"
+    businesses = []
+    append = businesses.append
+    for r in iterator:
+        d = dict(r)
+        rid = r.key.id
+        d["id"] = rid
+        d["self"] = prefix + str(rid)
+        if not sub:
+            d["inspection_score"] = None
+        append(d)
 
-@app.route('/businesses/<int:id>', methods=['DELETE'])
-def delete_business(id):
-    payload = verify_jwt(request)
-    if payload is None:
-        return {"Error": "Invalid JWT / Unauthorized access."}, 401
+    next_cursor = iterator.next_page_token
+    next_link = request.url_root + "businesses?cursor=" + next_cursor.decode() if next_cursor else None
+
+    return jsonify({"businesses": businesses, "next": next_link}), 200
 
-    business_key = client.key("businesses", id)
-    business = client.get(key=business_key)
-    
-    if not business or payload['sub'] != business['owner_id']:
-        return {"Error": "No business with this business_id exists"}, 403
 
+@app.route('/businesses/<int:id>', methods=['DELETE'])
+@require_business_owner
+def delete_business(id, business, business_key, payload):
     client.delete(business_key)
     return '', 204
 
 
+_REQUIRED_FIELDS = ('name', 'street_address', 'city', 'state', 'zip_code', 'inspection_score')
+
 def check_attributes(content):
-    return all(field in content and content[field] is not None for field in ['name','street_address', 'city', 'state', 'zip_code', 'inspection_score'])
+    # Hoisted field tuple and a short-circuiting loop instead of rebuilding
+    # the list and driving a generator through all() on every POST
+    get = content.get
+    for field in _REQUIRED_FIELDS:
+        if get(field) is None:
+            return False
+    return True
 
 
 # Decode the JWT supplied in the Authorization header
@@ -222,9 +287,10 @@ def login_user():
             'client_secret':CLIENT_SECRET
            }
     headers = { 'content-type': 'application/json' }
-    url = 'https://' + DOMAIN + '/oauth/token'
-    r = requests.post(url, json=body, headers=headers)
+    r = _AUTH0_SESSION.post(_AUTH0_TOKEN_URL, json=body, headers=headers, timeout=5)
     return r.text, 200, {'Content-Type':'application/json'}
 
 if __name__ == '__main__':
-    app.run(host='127.0.0.1', port=8080, debug=True)
+    # Local development only; deployed instances serve through gunicorn's
+    # threaded workers via the app.yaml entrypoint
+    app.run(host='127.0.0.1', port=8080)